@@ -1,6 +1,12 @@
 import pandas as pd
 from datetime import datetime
-from csup_analyzer.event.Result import RaceResult, QualiResult, RaceResultsDataFrame
+from typing import List
+from csup_analyzer.event.Result import (
+    Result,
+    RaceResult,
+    QualiResult,
+    RaceResultsDataFrame,
+)
 
 TRACK_NAMES_BY_REPLAY_NAMES = {
     "sunny-side-track": {"name": "Sunny Side Park", "layouts": {"Path-A": "GP"}},
@@ -78,17 +84,11 @@ class Event:
     def create_result_dataframe(self) -> None:
         # The main result dataframe will be a subclass of pd.DataFrame.
         # This allows us to create custom methods on it.
-        race_result_df = RaceResultsDataFrame(
-            [result.as_series() for result in self.race.results]
-        )
+        race_result_df = RaceResultsDataFrame(self.race.result_df)
 
         if self.quali:
-            quali_df = pd.concat(
-                [result.as_series() for result in self.quali.results], axis=1
-            ).transpose()
-
             race_result_df = race_result_df.join(
-                quali_df, lsuffix="_race", rsuffix="_quali"
+                self.quali.result_df, lsuffix="_race", rsuffix="_quali"
             )
         else:
             # even if we do not have quali data, we want the race columns to be suffixed in the same way
@@ -109,9 +109,27 @@ class Event:
 
 
 class Session:
+    # the kind of Result the drivers of this session have, see Race and Quali
+    result_class = Result
+
     def __init__(self, race_file_content: dict) -> None:
         self.assign_properties(race_file_content)
 
+        self._racer_results = race_file_content["raceResult"]["racerResults"]
+        self._results = None
+        # the results of all drivers as a dataframe, built in one go from the replay file
+        self.result_df = self.result_class.from_dicts(self._racer_results)
+
+    @property
+    def results(self) -> List[Result]:
+        # the Result instances per driver are only created when someone asks for them
+        if self._results is None:
+            self._results = [
+                self.result_class(result_dict) for result_dict in self._racer_results
+            ]
+
+        return self._results
+
     def assign_properties(self, r: dict) -> None:
         self.datetime_utc = datetime.strptime(r["timeStampUtc"], "%Y%m%dT%H:%M:%SZ")
 
@@ -155,20 +173,14 @@ class Session:
 
 
 class Race(Session):
+    result_class = RaceResult
+
     def __init__(self, race_file_content: dict) -> None:
         super().__init__(race_file_content)
 
-        self.results = [
-            RaceResult(result_dict)
-            for result_dict in race_file_content["raceResult"]["racerResults"]
-        ]
-
 
 class Quali(Session):
+    result_class = QualiResult
+
     def __init__(self, race_file_content: dict) -> None:
         super().__init__(race_file_content)
-
-        self.results = [
-            QualiResult(result_dict)
-            for result_dict in race_file_content["raceResult"]["racerResults"]
-        ]
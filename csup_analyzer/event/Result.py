@@ -1,8 +1,143 @@
+from typing import List
 import numpy as np
 import pandas as pd
 
 
+def _pad_lap_times(
+    lap_times: pd.Series, num_leading_columns: int = 0, order: str = "C"
+) -> np.ndarray:
+    """
+    Puts the lap time lists of all drivers into one matrix with a row per driver and a column per lap.
+    Drivers with less laps (or no lap times at all) are padded with NaN.
+    The lap times are stored as float32, the matrix is float64 so sums over many laps do not lose precision.
+
+    The first num_leading_columns columns are left empty (NaN) so the caller can fill them, f.e. with lap 0.
+    Pass order="F" if the matrix is mostly worked on lap by lap (column by column).
+    """
+    lap_times_lists = [
+        laps if isinstance(laps, (list, np.ndarray)) else [] for laps in lap_times
+    ]
+    num_laps = max(map(len, lap_times_lists), default=0)
+
+    padded = np.full(
+        (len(lap_times_lists), num_leading_columns + num_laps),
+        np.nan,
+        dtype=np.float64,
+        order=order,
+    )
+    for i, laps in enumerate(lap_times_lists):
+        padded[i, num_leading_columns : num_leading_columns + len(laps)] = laps
+
+    return padded
+
+
+def _rank_laps(cum_times: np.ndarray) -> np.ndarray:
+    """
+    Calculates the position of every driver (rows) on every lap (columns) out of the cumulative times.
+    Drivers without a time on a lap (NaN) get the position -1 there.
+
+    All laps are ranked at once: sorting every column gives the driver order per lap (NaN is sorted last)
+    and writing 1..N back to those rows turns it into the position of each driver.
+    """
+    order = np.argsort(cum_times, axis=0, kind="stable")
+
+    positions = np.empty(cum_times.shape, dtype=np.int32, order="F")
+    np.put_along_axis(
+        positions,
+        order,
+        np.arange(1, cum_times.shape[0] + 1, dtype=np.int32)[:, None],
+        axis=0,
+    )
+    positions[np.isnan(cum_times)] = -1
+
+    return positions
+
+
+def _positions_from_order(order: np.ndarray) -> np.ndarray:
+    """
+    Turns the order of the rows (as returned by np.argsort / np.lexsort) into a 1-based position per row.
+    int32 is plenty for positions and takes half the memory of the default int64.
+    """
+    positions = np.empty(len(order), dtype=np.int32)
+    positions[order] = np.arange(1, len(order) + 1, dtype=np.int32)
+
+    return positions
+
+
+def _float32_sort_key(values: np.ndarray) -> np.ndarray:
+    """
+    Maps float32 values to uint32 keys that sort in the same order as the values, NaN is sorted last.
+
+    The IEEE bit pattern already sorts like the value for positive numbers once the sign bit is set,
+    negative numbers need all of their bits flipped to reverse their order.
+    """
+    bits = values.view(np.uint32)
+    is_negative = (bits >> np.uint32(31)).astype(bool)
+    keys = np.where(is_negative, ~bits, bits | np.uint32(0x80000000))
+    keys[np.isnan(values)] = np.iinfo(np.uint32).max
+
+    return keys
+
+
+def _backfill_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    Replaces every NaN with the next value to the right in the same row that is not NaN (a backfill along the rows).
+    NaN stays NaN if there is no such value.
+    """
+    num_columns = matrix.shape[1]
+
+    # for every cell the column of the next value that is not NaN (scanning from the right)
+    # if there is none, the index points at the last column which is NaN then as well
+    next_valid_column = np.where(
+        ~np.isnan(matrix), np.arange(num_columns), num_columns - 1
+    )
+    next_valid_column = np.minimum.accumulate(next_valid_column[:, ::-1], axis=1)
+    next_valid_column = next_valid_column[:, ::-1]
+
+    return np.take_along_axis(matrix, next_valid_column, axis=1)
+
+
+def _as_time(time) -> np.float32:
+    # the replay files hold None for a time that was not set, f.e. the total time if the driver did not finish
+    return np.float32(np.nan if time is None else time)
+
+
+def _as_lap_times(lap_times) -> np.ndarray:
+    return np.asarray(lap_times or [], dtype=np.float32)
+
+
 class Result:
+    # the properties read from the replay file: property -> (key in the replay file, conversion of the value)
+    # assign_individual_properties() sets them on a single result, from_dicts() builds a column of each
+    _REPLAY_PROPERTIES = {
+        # this is the total time from session begin until the driver finsished the last lap
+        # this is NaN if the driver did not finish
+        # it does include the time a driver needs in "lap 0" until the beginning of lap 1 (crossing the start/finish line)
+        "total_time": ("finishTime", _as_time),
+        # array of lap times, empty if the driver did not complete a lap
+        "lap_times": ("lapTimes", _as_lap_times),
+        # list of time penalties per lap, it does not include hitting CCDs during the race cause that
+        # only slows you down (it does not give a time penalty)
+        "lap_time_penalties": ("lapTimePenalties", None),
+        # how many laps the driver led; interesting in a multi-lap quali
+        "num_laps_led": ("numLapsLed", None),
+        # metres driven, not sure if relevant
+        "metres_driven": ("metresDriven", None),
+    }
+
+    # the properties as_series() is made of (in that order), from_dicts() creates the same columns
+    # for a whole session the derived ones are calculated for all drivers at once, see batch_derive()
+    _SERIES_ATTRS = (
+        "fastest_lap_time",
+        "lap_time_penalties",
+        "lap_times",
+        "metres_driven",
+        "num_laps_driven",
+        "num_laps_led",
+        "time_until_starting_line",
+        "total_time",
+    )
+
     def __init__(self, results_dict: dict) -> None:
         self.assign_individual_properties(results_dict)
         self.series = None
@@ -17,47 +152,88 @@ class Result:
         """
         self.driver_id = res["racingTeamId"]
 
-        # this is the total time from session begin until the driver finsished the last lap
-        # this is None if the driver did not finish
-        # it does include the time a driver needs in "lap 0" until the beginning of lap 1 (crossing the start/finish line)
-        self.total_time = res["finishTime"]
-        # list of lap times
-        self.lap_times = res["lapTimes"]
+        for attr, (key, convert) in self._REPLAY_PROPERTIES.items():
+            setattr(self, attr, res[key] if convert is None else convert(res[key]))
+
+    @property
+    def num_laps_driven(self):
         # number of laps driven, relevant for lappings
-        self.num_laps_driven = len(self.lap_times) if self.lap_times else np.nan
+        return len(self.lap_times) if self.lap_times.size else np.nan
+
+    @property
+    def fastest_lap_time(self):
         # minimum lap time
-        self.fastest_lap_time = min(self.lap_times) if self.lap_times else np.nan
-        # list of time penalties per lap, it does not include hitting CCDs during the race cause that
-        # only slows you down (it does not give a time penalty)
-        self.lap_time_penalties = res["lapTimePenalties"]
-        # how many laps the driver led; interesting in a multi-lap quali
-        self.num_laps_led = res["numLapsLed"]
-        # metres driven, not sure if relevant
-        self.metres_driven = res["metresDriven"]
+        return self.lap_times.min() if self.lap_times.size else np.float32(np.nan)
+
+    @property
+    def time_until_starting_line(self):
+        # see batch_derive(), NaN if the driver did not finish
+        return np.float32(float(self.total_time) - self.lap_times.sum(dtype=np.float64))
+
+    @classmethod
+    def batch_derive(cls, df: pd.DataFrame, suffix: str = "") -> None:
+        """
+        Derives the properties of all drivers that follow from their lap times in one go.
+        Doing this on a padded matrix instead of per driver keeps the work out of the python interpreter.
+
+        The suffix is the one of the session columns in df, f.e. "_race".
+        """
+        lap_times = _pad_lap_times(df[f"lap_times{suffix}"])
+        has_lap_time = ~np.isnan(lap_times)
+        num_laps_driven = has_lap_time.sum(axis=1)
+
+        # number of laps driven, relevant for lappings
+        df[f"num_laps_driven{suffix}"] = np.where(
+            num_laps_driven > 0, num_laps_driven, np.nan
+        )
+        # minimum lap time
+        df[f"fastest_lap_time{suffix}"] = np.where(
+            num_laps_driven > 0,
+            np.min(lap_times, axis=1, initial=np.inf, where=has_lap_time),
+            np.nan,
+        ).astype(np.float32)
 
         # as the total time includes the time from the starting position to the start/finish line
         # and the lap times do not, we can extract the time the driver needed to get there
         # This is relevant to calculate positions per lap because we need to add this time to the lap times
         # in order to calculate positions
-        self.time_until_starting_line = (
-            self.total_time - sum(self.lap_times) if self.total_time else None
+        # this is NaN if the driver did not finish
+        df[f"time_until_starting_line{suffix}"] = (
+            df[f"total_time{suffix}"].to_numpy(dtype=np.float64)
+            - np.nansum(lap_times, axis=1)
+        ).astype(np.float32)
+
+    @classmethod
+    def from_dicts(cls, results_dicts: List[dict]) -> pd.DataFrame:
+        """
+        Builds the results of a whole session straight from the replay file, column by column instead of
+        creating a Result instance per driver first. Every row is a driver (indexed by the driver id) and
+        the columns are the properties of assign_individual_properties() plus those of batch_derive().
+
+        The times are stored as float32. The game writes them with float32 precision anyway, so nothing is lost
+        but half of the memory.
+        """
+        df = pd.DataFrame(
+            {
+                attr: [
+                    res[key] if convert is None else convert(res[key])
+                    for res in results_dicts
+                ]
+                for attr, (key, convert) in cls._REPLAY_PROPERTIES.items()
+            },
+            index=[res["racingTeamId"] for res in results_dicts],
         )
+        cls.batch_derive(df)
+
+        return df[list(cls._SERIES_ATTRS)]
 
     def as_series(self) -> pd.Series:
         if self.series is None:
-            property_attributes = [
-                attr
-                for attr in dir(self)
-                if not attr.startswith("__")
-                and not callable(getattr(self, attr))
-                and attr not in ["series", "driver_id"]
-            ]
-
-            indices = property_attributes
+            data = [getattr(self, attr) for attr in self._SERIES_ATTRS]
 
-            data = [getattr(self, attr) for attr in property_attributes]
-
-            self.series = pd.Series(data=data, index=indices, name=self.driver_id)
+            self.series = pd.Series(
+                data=data, index=self._SERIES_ATTRS, name=self.driver_id
+            )
 
         return self.series
 
@@ -72,6 +248,18 @@ class QualiResult(Result):
         super().__init__(results_dict)
 
 
+class _IndexedCache:
+    """
+    A value calculated for exactly the rows (index) of a RaceResultsDataFrame.
+
+    The index is kept to tell if the value still fits, f.e. after the frame got sorted in place.
+    """
+
+    def __init__(self, index: pd.Index, value) -> None:
+        self.index = index
+        self.value = value
+
+
 class RaceResultsDataFrame(pd.DataFrame):
     # this makes sure that when you would normally construct a new dataframe when applying pandas functions
     # it instead will construct a RaceResultsDataFrame instance making sure that the methods defined below
@@ -80,9 +268,22 @@ class RaceResultsDataFrame(pd.DataFrame):
     def _constructor(self):
         return RaceResultsDataFrame
 
+    # set on the instance once the calculations started, see _run_result_calculations(). it is not listed
+    # in _metadata, so pandas does not hand it on to derived frames, which may have other columns
+    _has_quali = None
+
+    # memo of lap_position_table, like _has_quali it stays with the instance it was built for
+    _lap_position_table_cache = None
+
+    # the back-filled lap table of __calc_lap_positions() (a row per driver, a column per lap) it is built from
+    _lap_positions_matrix = None
+
     @property
     def has_quali_data(self):
-        return any([col.endswith("_quali") for col in self.columns])
+        if self._has_quali is not None:
+            return self._has_quali
+
+        return any(col.endswith("_quali") for col in self.columns)
 
     @property
     def participants(self):
@@ -96,14 +297,28 @@ class RaceResultsDataFrame(pd.DataFrame):
                 "WARNING: You tried to get the lap_position_table before running '__calc_lap_positions()'. I did this for you although you should handle that. Do not run it twice."
             )
 
+        # the table only depends on the lap positions, so it is built once per instance
+        # the index tells if rows got added, removed or reordered in place since then
+        cache = self._lap_position_table_cache
+        if cache is not None and cache.index.equals(self.index):
+            return cache.value
+
         # create lap table dataframe that has a column for every lap and a row for every driver
-        df = pd.DataFrame(self["lap_positions_race"].to_list())
-        df.index = self["name"]
+        matrix = self._lap_positions_matrix
+        if matrix is not None and self.index.isin(matrix.index).all():
+            # the rows of the matrix are in the order of the calculation, self may have been sorted since then
+            lap_table = matrix.value[matrix.index.get_indexer(self.index)]
+        else:
+            # frames derived from self do not get the matrix (it is not in _metadata), so the lists are used
+            lap_table = np.array(self["lap_positions_race"].to_list(), dtype=np.float64)
+        df = pd.DataFrame(lap_table, index=self["name"])
 
         # transposed every column name is a driver name and every row index is the laps completed
         df = df.transpose()
         df.index.rename("laps completed", inplace=True)
 
+        self._lap_position_table_cache = _IndexedCache(self.index, df)
+
         return df
 
     def _run_result_calculations(self) -> None:
@@ -111,23 +326,23 @@ class RaceResultsDataFrame(pd.DataFrame):
         Until this point self is a pandas dataframe with all the information from the header file(s).
 
         These are the columns which are available (the _quali columns only if a quali header files was provided):
-        - 'fastest_lap_time_race'
         - 'lap_time_penalties_race'
         - 'lap_times_race'
         - 'metres_driven_race'
-        - 'num_laps_driven_race'
         - 'num_laps_led_race'
-        - 'time_until_starting_line_race'
         - 'total_time_race'
+        - 'num_laps_driven_race'
+        - 'fastest_lap_time_race'
+        - 'time_until_starting_line_race'
 
-        - 'fastest_lap_time_quali'
         - 'lap_time_penalties_quali'
         - 'lap_times_quali'
         - 'metres_driven_quali'
-        - 'num_laps_driven_quali'
         - 'num_laps_led_quali'
-        - 'time_until_starting_line_quali'
         - 'total_time_quali'
+        - 'num_laps_driven_quali'
+        - 'fastest_lap_time_quali'
+        - 'time_until_starting_line_quali'
 
         - 'car'
         - 'colors'
@@ -138,48 +353,82 @@ class RaceResultsDataFrame(pd.DataFrame):
 
         Now it is about calculating more valuable variables out of the data available, f.e. positions per lap.
         """
+        self._has_quali = any(col.endswith("_quali") for col in self.columns)
+
         self.__calc_starting_position()
         self.__calc_race_position()
         self.__interpolate_time_until_starting_line_race()
         self.__calc_lap_positions()
 
+        # the positions above are calculated without reordering the rows, so we only sort once for display
+        self.sort_values(by="end_position_race", inplace=True)
+
     def __calc_starting_position(self):
+        time_until_starting_line_race = self["time_until_starting_line_race"].to_numpy(
+            dtype=np.float64
+        )
+
         if self.has_quali_data:
-            self.sort_values(
-                by=["fastest_lap_time_quali", "time_until_starting_line_race"],
-                ascending=True,
-                inplace=True,
+            # np.lexsort sorts by the last key first
+            order = np.lexsort(
+                (
+                    time_until_starting_line_race,
+                    self["fastest_lap_time_quali"].to_numpy(dtype=np.float64),
+                )
             )
         else:
             # if we do not have the quali data, we estimate who started the race at which position
             # based on the time they needed in the beginning to cross the start/finish line (from lap 0 to lap 1 basically)
             # This should be very precise if everyone starts the race and no mayhem happens before the line ;)
-            self.sort_values(
-                by="time_until_starting_line_race", ascending=True, inplace=True
-            )
-        self["starting_position_race"] = list(range(1, len(self.index) + 1))
+            order = np.argsort(time_until_starting_line_race, kind="stable")
+        self["starting_position_race"] = _positions_from_order(order)
 
     def __calc_race_position(self):
-        self.sort_values(
-            by=["num_laps_driven_race", "total_time_race", "starting_position_race"],
-            ascending=[False, True, True],
-            inplace=True,
+        # most laps first, then the fastest total time, then the better starting position
+        # all three are packed into one 64 bit key per driver so a single argsort does the job:
+        # 16 bits inverted number of laps | 32 bits total time | 16 bits starting position
+        # drivers without laps count as 0 laps, drivers without total time come last in their lap group
+        num_laps_driven = np.nan_to_num(
+            self["num_laps_driven_race"].to_numpy(dtype=np.float64)
+        ).astype(np.uint64)
+        total_time = _float32_sort_key(
+            self["total_time_race"].to_numpy(dtype=np.float32)
+        ).astype(np.uint64)
+        starting_position = self["starting_position_race"].to_numpy().astype(np.uint64)
+
+        key = (
+            ((np.uint64(0xFFFF) - num_laps_driven) << np.uint64(48))
+            | (total_time << np.uint64(16))
+            | starting_position
+        )
+        self["end_position_race"] = _positions_from_order(
+            np.argsort(key, kind="stable")
         )
-        self["end_position_race"] = list(range(1, len(self.index) + 1))
 
     def __interpolate_time_until_starting_line_race(self):
-        # creating a series to create an index with equal distances for interpolation
-        time_until_starting_line_race = self["time_until_starting_line_race"]
-        time_until_starting_line_race.index = list(range(1, len(self.index) + 1))
+        # drivers that did not finish have no total time and therefore no time until the starting line
+        # we estimate it from the other drivers with the finishing positions as equally spaced x values (1, 2, 3, ...)
+        time_until_starting_line_race = self["time_until_starting_line_race"].to_numpy(
+            dtype=np.float64
+        )
+        has_time = ~np.isnan(time_until_starting_line_race)
+        # a fit of order 2 needs at least three drivers with a time, without them the NaNs stay as they are
+        if has_time.all() or has_time.sum() < 3:
+            return
 
-        # spline is able to extrapolate as well
+        positions = self["end_position_race"].to_numpy()
+
+        # a polynomial fit is able to extrapolate as well
         # order 2 as the speed difference drivers have when crossing the start finish line decreases
         # the further back you go in the starting grid (P1 much slower than P2 but P11 and P12 similar if not identical)
-        self[
-            "time_until_starting_line_race"
-        ] = time_until_starting_line_race.interpolate(
-            method="spline", order=2, inplace=False
-        ).values
+        coefficients = np.polyfit(
+            positions[has_time], time_until_starting_line_race[has_time], 2
+        )
+        self["time_until_starting_line_race"] = np.where(
+            has_time,
+            time_until_starting_line_race,
+            np.polyval(coefficients, positions),
+        ).astype(np.float32)
 
     def __calc_lap_positions(self):
         """
@@ -187,9 +436,13 @@ class RaceResultsDataFrame(pd.DataFrame):
         In order reduce complexity we will create another dataframe called df that only holds the information we need.
         """
 
-        # remove those that have no lap times and reduce the columns to what we really need
+        # a lap position table built from earlier positions is outdated now
+        self._lap_position_table_cache = None
+
+        # reduce the columns to what we really need
+        # drivers without lap times stay in, their laps in cum_times are all NaN
         df = self.loc[
-            ~self["lap_times_race"].isna(),
+            :,
             [
                 "name",
                 "time_until_starting_line_race",
@@ -199,63 +452,51 @@ class RaceResultsDataFrame(pd.DataFrame):
             ],
         ]
 
-        df_lap_times = pd.DataFrame(df["lap_times_race"].to_list())
-        df_lap_times.index = df.index
-
-        df_lap_times = pd.concat(
-            [df["time_until_starting_line_race"], df_lap_times],
-            axis=1,
-            ignore_index=True,
+        # cumulative time of every driver (rows) when crossing the start/finish line on every lap (columns)
+        # lap 0 is the time until the starting line, drivers with less laps are padded with NaN
+        # the matrix is column-major as every lap (column) gets sorted on its own below
+        cum_times = _pad_lap_times(
+            df["lap_times_race"], num_leading_columns=1, order="F"
         )
-        df_lap_times = df_lap_times.cumsum(axis=1)
-        df = pd.concat([df, df_lap_times], axis=1)
-        del df["lap_times_race"]
+        cum_times[:, 0] = df["time_until_starting_line_race"].to_numpy(dtype=np.float64)
+        np.cumsum(cum_times, axis=1, out=cum_times)
 
-        # now we have a df with the team id as an index and the lap numbers (from 0 to e.g. 10) as a column
+        # now we have a matrix with a row per driver and a column per lap number (from 0 to e.g. 10)
         # we do know the starting positions and the finishing positions already via the "starting_position" / "race_position" columns within df
 
-        for col in df_lap_times.columns:
-            df.sort_values(by=col, inplace=True)
-            df[f"Lap {col}"] = list(range(1, len(df.index) + 1))
-            df.loc[df[col].isnull(), f"Lap {col}"] = np.NaN
-            col_pos_last_lap = f"Lap {col}"
+        lap_positions = _rank_laps(cum_times).astype(np.float64)
+        lap_positions[lap_positions == -1] = np.nan
 
-        for _, row in df[["name", col_pos_last_lap, "end_position_race"]].iterrows():
-            if np.isnan(row[col_pos_last_lap]):
-                continue
+        # drivers that did not complete the last lap (NaN) cannot be checked
+        last_lap_positions = lap_positions[:, -1]
+        end_positions = df["end_position_race"].to_numpy()
+        names = df["name"].to_numpy()
+        is_incorrect = ~np.isnan(last_lap_positions) & (
+            last_lap_positions != end_positions
+        )
 
-            if row[col_pos_last_lap] != row["end_position_race"]:
-                print(
-                    f'Calculated position seems to be incorrect. Expected pos {row["end_position_race"]} at the end for {row["name"]} but found {row[col_pos_last_lap]}.'
-                )
+        for i in np.flatnonzero(is_incorrect):
+            print(
+                f"Calculated position seems to be incorrect. Expected pos {end_positions[i]} at the end for {names[i]} but found {last_lap_positions[i]}."
+            )
 
-        df.sort_values(by="end_position_race", inplace=True)
+        lap_positions[:, -1] = end_positions
 
-        df[col_pos_last_lap] = df["end_position_race"]
-
-        df_lap_table = df.loc[
-            :,
-            ["starting_position_race"]
-            + [
-                col
-                for col in df.columns
-                if isinstance(col, str) and col.startswith("Lap") and col != "Lap 0"
-            ],
-        ]
+        # the lap table starts with the starting position instead of the position on lap 0
+        lap_table = np.empty(lap_positions.shape, dtype=np.float64)
+        lap_table[:, 0] = df["starting_position_race"].to_numpy()
+        lap_table[:, 1:] = lap_positions[:, 1:]
 
         # if someone has been lapped we want to see the final position anyways
         # example: there are 20 laps and someone did 18. We know his position until lap 18 and in the finish (lap 20)
         # therefore when backfilling we fill lap 19 position with the position at lap 20 cause that should be the same
-        df_lap_table = df_lap_table.fillna(method="bfill", axis=1)
+        lap_table = _backfill_rows(lap_table)
+        self._lap_positions_matrix = _IndexedCache(self.index, lap_table)
 
         # add the lap positions in a column of self as a list
-        df_lap_table["lap_positions_race"] = df_lap_table.values.tolist()
-
-        self["lap_positions_race"] = np.nan
-
-        for i, value in df_lap_table["lap_positions_race"].items():
-            # simply assigning a list does not work unfortunately:
-            # error: ValueError: Must have equal len keys and value when setting with an iterable
-            self.loc[self.index == i, "lap_positions_race"] = self.loc[
-                self.index == i, "lap_positions_race"
-            ].apply(lambda _: value)
+        # simply assigning the lists does not work unfortunately (pandas tries to broadcast them):
+        # error: ValueError: Must have equal len keys and value when setting with an iterable
+        # so they are wrapped in an object series first, the rows of lap_table are those of self
+        self["lap_positions_race"] = pd.Series(
+            lap_table.tolist(), index=self.index, dtype=object
+        )